@@ -1,15 +1,89 @@
 import asyncio
+import contextvars
+import functools
 
-from asgiref.sync import async_to_sync
+from asgiref.sync import async_to_sync, sync_to_async
 from django.conf import settings
 from django.http import StreamingHttpResponse
 
-from .formatting import HEARTBEAT, format_patch_elements, format_patch_signals
+from .formatting import (
+    HEARTBEAT,
+    _format_elements_cached,
+    format_patch_elements,
+    format_patch_signals,
+)
 from .registry import registry
+from .ring import SPSCRing
 
 HEARTBEAT_INTERVAL = getattr(settings, "DS_BROADCASTER_HEARTBEAT_INTERVAL", 15)
+MAX_BATCH = getattr(settings, "DS_BROADCASTER_MAX_BATCH", 64)
+PRESENCE_DEBOUNCE = getattr(settings, "DS_BROADCASTER_PRESENCE_DEBOUNCE", 0.05)
 
-_CLOSE = object()  # sentinel pushed into a queue to force-close that stream
+_CLOSE = object()  # sentinel pushed into a ring to force-close that stream
+
+
+class SSEStream:
+    """Async iterator that streams one connection's ring as SSE chunks.
+
+    A plain class rather than an async generator, so each chunk costs a
+    method call instead of a generator resumption. StreamingHttpResponse
+    registers close() as a resource closer; Django calls it when the
+    response finishes or the client disconnects, which runs on_close on
+    the event loop exactly once.
+    """
+
+    def __init__(self, ring, on_close):
+        self._ring = ring
+        self._on_close = on_close
+        self._loop = asyncio.get_running_loop()
+        self._last_sent = self._loop.time()
+        self._finished = False
+        self._closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._finished:
+            self.close()
+            raise StopAsyncIteration
+
+        ring = self._ring
+        if ring.empty():
+            # Only arm a heartbeat timer when there is nothing to send,
+            # rather than one wait_for timer per event.
+            timeout = HEARTBEAT_INTERVAL - (self._loop.time() - self._last_sent)
+            try:
+                await asyncio.wait_for(ring.wait_for_data(), timeout)
+            except asyncio.TimeoutError:
+                self._last_sent = self._loop.time()
+                return HEARTBEAT
+
+        # Drain everything pending so one send() carries a whole burst.
+        events = ring.pop_nowait_all(MAX_BATCH)
+        try:
+            end = events.index(_CLOSE)
+        except ValueError:
+            pass
+        else:
+            # Flush what was queued before the sentinel, then stop.
+            self._finished = True
+            events = events[:end]
+            if not events:
+                self.close()
+                raise StopAsyncIteration
+        self._last_sent = self._loop.time()
+        return b"".join(events)
+
+    def close(self):
+        """Unregister the connection. Safe to call from any thread, repeatedly."""
+        if self._closed:
+            return
+        self._closed = True
+        if registry.on_loop_thread():
+            self._on_close()
+        elif not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._on_close)
 
 
 class Broadcaster:
@@ -22,6 +96,7 @@ class Broadcaster:
         broadcast.signals(channel, signals_dict)          # send signals
         broadcast.new(channel, presence_callback=fn)      # create channel (optional presence)
         broadcast.connect(channel, request)               # open SSE stream + register user + broadcast presence
+        await broadcast.aconnect(channel, request)        # same, from an async view
         broadcast.disconnect(channel, user_id)            # force-close a user's connections + broadcast presence
         broadcast.kill(channel)                           # destroy channel (closes all connections)
         broadcast.get_users(channel)                      # get list of connected user IDs (int)
@@ -41,6 +116,10 @@ class Broadcaster:
     The callback is called synchronously in a thread pool — it is safe to use
     Django ORM queries inside it. Do not define it as async.
 
+    Bursts of connects/disconnects are coalesced: the callback runs at most
+    once per PRESENCE_DEBOUNCE window per channel, never concurrently with
+    itself for the same channel, and always sees the latest user list.
+
     The returned HTML string is broadcast to all connected clients as a
     datastar-patch-elements event (replacing the element with id="room-members"
     by default, or whatever id your presence template renders).
@@ -65,17 +144,29 @@ class Broadcaster:
     on connect or disconnect.
     """
 
-    def __call__(self, channel, html, *, selector=None, mode=None):
+    def __init__(self):
+        # Per-channel presence coalescing state; only touched on the event loop.
+        self._presence_pending: dict[str, asyncio.TimerHandle] = {}
+        self._presence_running: set[str] = set()
+        self._presence_dirty: set[str] = set()
+
+    def __call__(self, channel, html, *, selector=None, mode=None, collapse_ws=True):
         """Send elements (default). Alias for self.elements()."""
-        self.elements(channel, html, selector=selector, mode=mode)
+        self.elements(channel, html, selector=selector, mode=mode, collapse_ws=collapse_ws)
 
-    def elements(self, channel, html, *, selector=None, mode=None):
+    def elements(self, channel, html, *, selector=None, mode=None, collapse_ws=True):
         """Send a datastar-patch-elements event to all clients on the channel."""
-        event = format_patch_elements(html, selector=selector, mode=mode)
+        if not registry.channel_size(channel):
+            return
+        event = format_patch_elements(
+            html, selector=selector, mode=mode, collapse_ws=collapse_ws
+        )
         self._put(channel, event)
 
     def signals(self, channel, signals):
         """Send a datastar-patch-signals event to all clients on the channel."""
+        if not registry.channel_size(channel):
+            return
         event = format_patch_signals(signals)
         self._put(channel, event)
 
@@ -94,40 +185,27 @@ class Broadcaster:
         Creates the channel if it doesn't exist. Cleans up and broadcasts updated
         presence automatically when the client disconnects.
 
-        Can be called from a plain sync view — no async required.
+        Can be called from a plain sync view — no async required. Async views
+        should await aconnect() instead, which avoids the async_to_sync hop.
 
         Returns a StreamingHttpResponse.
         """
-        return async_to_sync(self._connect)(channel, request, presence_callback=presence_callback)
+        return async_to_sync(self.aconnect)(channel, request, presence_callback=presence_callback)
+
+    async def aconnect(self, channel, request, *, presence_callback=None):
+        """Async version of connect(), for use from async views.
 
-    async def _connect(self, channel, request, *, presence_callback=None):
-        """Async implementation of connect."""
+        Returns a StreamingHttpResponse.
+        """
         registry.set_loop(asyncio.get_running_loop())
         registry.create(channel, presence_callback=presence_callback)
 
-        queue = asyncio.Queue()
+        ring = SPSCRing(capacity=256)
         user = await request.auser()
-        self._add_user(channel, queue, user)
-
-        async def event_stream():
-            try:
-                while True:
-                    try:
-                        event = await asyncio.wait_for(
-                            queue.get(), timeout=HEARTBEAT_INTERVAL
-                        )
-                        if event is _CLOSE:
-                            return
-                        yield event
-                    except asyncio.TimeoutError:
-                        yield HEARTBEAT
-            except (asyncio.CancelledError, GeneratorExit):
-                pass
-            finally:
-                self._remove_user(channel, queue)
+        self._add_user(channel, ring, user)
 
         response = StreamingHttpResponse(
-            event_stream(),
+            SSEStream(ring, functools.partial(self._remove_user, channel, ring)),
             content_type="text/event-stream",
         )
         response["Cache-Control"] = "no-cache"
@@ -137,40 +215,30 @@ class Broadcaster:
     def disconnect(self, channel, user_id):
         """Force-close all SSE connections for a user on a channel.
 
-        Pushes a close sentinel into each of the user's queues. The stream
-        generator exits cleanly and broadcasts updated presence to remaining users.
+        Pushes a close sentinel into each of the user's rings. The stream
+        ends cleanly and broadcasts updated presence to remaining users.
         """
-        queues = registry.get_queues_for_user(channel, user_id)
-        if not queues:
+        rings = registry.get_queues_for_user(channel, user_id)
+        if not rings:
+            return
+        if registry.on_loop_thread():
+            self._fan_out_on_loop(rings, _CLOSE)
             return
         loop = registry.get_loop()
         if loop is None or loop.is_closed():
             return
-        try:
-            running_loop = asyncio.get_running_loop()
-        except RuntimeError:
-            running_loop = None
-        for queue in queues:
-            if running_loop is loop:
-                queue.put_nowait(_CLOSE)
-            else:
-                loop.call_soon_threadsafe(queue.put_nowait, _CLOSE)
+        loop.call_soon_threadsafe(self._fan_out_on_loop, rings, _CLOSE)
 
     def kill(self, channel):
         """Destroy a channel, force-closing all connections."""
-        queues = registry.get_queues(channel)
-        if queues:
-            loop = registry.get_loop()
-            if loop and not loop.is_closed():
-                try:
-                    running_loop = asyncio.get_running_loop()
-                except RuntimeError:
-                    running_loop = None
-                for queue in queues:
-                    if running_loop is loop:
-                        queue.put_nowait(_CLOSE)
-                    else:
-                        loop.call_soon_threadsafe(queue.put_nowait, _CLOSE)
+        rings = registry.get_queues(channel)
+        if rings:
+            if registry.on_loop_thread():
+                self._fan_out_on_loop(rings, _CLOSE)
+            else:
+                loop = registry.get_loop()
+                if loop and not loop.is_closed():
+                    loop.call_soon_threadsafe(self._fan_out_on_loop, rings, _CLOSE)
         registry.destroy(channel)
 
     def get_users(self, channel):
@@ -181,91 +249,134 @@ class Broadcaster:
         """Return list of active channel names."""
         return registry.get_channels()
 
-    def _add_user(self, channel, queue, user):
+    def _add_user(self, channel, ring, user):
         """Register a user connection and broadcast updated presence."""
-        user_id = user.pk if hasattr(user, "pk") else 0
-        registry.add_user(channel, queue, user_id)
+        # AnonymousUser.pk is None; record anonymous connections as 0.
+        user_id = getattr(user, "pk", 0) or 0
+        registry.add_user(channel, ring, user_id)
         self._broadcast_presence(channel)
 
-    def _remove_user(self, channel, queue):
+    def _remove_user(self, channel, ring):
         """Unregister a user connection and broadcast updated presence."""
-        registry.remove_user(channel, queue)
+        registry.remove_user(channel, ring)
         if registry.get_queues(channel):
             self._broadcast_presence(channel)
 
     def _broadcast_presence(self, channel):
-        """Broadcast the current presence list to all users on the channel.
+        """Schedule a presence broadcast for the channel.
 
-        The presence callback may return:
-        - str: HTML only (broadcast as datastar-patch-elements)
-        - dict: signals only (broadcast as datastar-patch-signals)
-        - (str, dict): HTML + signals (both broadcast)
-        - (None, dict): signals only (tuple form)
+        On the event loop, calls are debounced per channel: a burst of
+        connects/disconnects within PRESENCE_DEBOUNCE seconds produces a
+        single callback invocation, made with the user list as it is when
+        the timer fires.
         """
         config = registry.get_config(channel)
         callback = config.get("presence_callback")
         if callback is None:
             return
 
-        user_ids = registry.get_users(channel)
-        # Deduplicate (same user, multiple tabs)
-        unique_ids = list(dict.fromkeys(user_ids))
-
-        def _dispatch(result):
-            if isinstance(result, tuple):
-                html, signals = result
-            elif isinstance(result, dict):
-                html, signals = None, result
-            else:
-                html, signals = result, None
-
-            if html:
-                self._put(channel, format_patch_elements(html))
-            if signals:
-                self._put(channel, format_patch_signals(signals))
-
-        # _broadcast_presence is called from _add_user/_remove_user which run
-        # inside the async event loop (_connect is async). The callback may do
-        # sync Django ORM work, which must not run on the event loop thread.
-        # Schedule it as a Task using sync_to_async so it runs in a thread pool.
         try:
             loop = asyncio.get_running_loop()
         except RuntimeError:
             loop = None
 
-        if loop is not None:
-            from asgiref.sync import sync_to_async
-            async def _run():
-                result = await sync_to_async(callback)(channel, unique_ids)
-                _dispatch(result)
-            loop.create_task(_run())
+        if loop is None:
+            unique_ids = registry.get_unique_users(channel)
+            self._dispatch_presence(channel, callback(channel, unique_ids))
+        elif channel not in self._presence_pending:
+            # Arm the timer in an empty context: call_later would otherwise
+            # copy the caller's, and connect() from a sync view carries an
+            # asgiref executor that has quit by the time the timer fires.
+            self._presence_pending[channel] = loop.call_later(
+                PRESENCE_DEBOUNCE, self._flush_presence, channel,
+                context=contextvars.Context(),
+            )
+
+    def _flush_presence(self, channel):
+        """Run the presence callback for a channel once its debounce expires."""
+        self._presence_pending.pop(channel, None)
+        if channel in self._presence_running:
+            # A callback is still in flight; run again once it finishes so
+            # the last broadcast reflects the latest state.
+            self._presence_dirty.add(channel)
+            return
+
+        callback = registry.get_config(channel).get("presence_callback")
+        if callback is None or not registry.get_queues(channel):
+            return
+
+        # Deduplicated: the same user on multiple tabs counts once.
+        unique_ids = registry.get_unique_users(channel)
+
+        # The callback may do sync Django ORM work, which must not run on the
+        # event loop thread. Run it as a Task using sync_to_async so it
+        # executes in a thread pool.
+        self._presence_running.add(channel)
+        asyncio.get_running_loop().create_task(
+            self._run_presence(channel, callback, unique_ids)
+        )
+
+    async def _run_presence(self, channel, callback, user_ids):
+        try:
+            result = await sync_to_async(callback)(channel, user_ids)
+            self._dispatch_presence(channel, result)
+        finally:
+            self._presence_running.discard(channel)
+            if channel in self._presence_dirty:
+                self._presence_dirty.discard(channel)
+                self._broadcast_presence(channel)
+
+    def _dispatch_presence(self, channel, result):
+        """Broadcast the result of a presence callback.
+
+        The presence callback may return:
+        - str: HTML only (broadcast as datastar-patch-elements)
+        - dict: signals only (broadcast as datastar-patch-signals)
+        - (str, dict): HTML + signals (both broadcast)
+        - (None, dict): signals only (tuple form)
+        """
+        if isinstance(result, tuple):
+            html, signals = result
+        elif isinstance(result, dict):
+            html, signals = None, result
         else:
-            result = callback(channel, unique_ids)
-            _dispatch(result)
+            html, signals = result, None
+
+        if html and signals:
+            # One fan-out for both events; the stream writes them together.
+            self._put(
+                channel,
+                _format_elements_cached(html) + format_patch_signals(signals),
+            )
+        elif html:
+            self._put(channel, _format_elements_cached(html))
+        elif signals:
+            self._put(channel, format_patch_signals(signals))
 
     def _put(self, channel, event):
-        """Push an event to all user queues on a channel.
+        """Push an event to all user rings on a channel.
 
         From async context (same event loop): puts directly.
-        From sync context (thread pool): uses call_soon_threadsafe.
+        From sync context (thread pool): schedules a single fan-out callback
+        on the loop with call_soon_threadsafe.
         Requires uvicorn or similar ASGI server with a persistent event loop.
         """
-        queues = registry.get_queues(channel)
-        if not queues:
+        rings = registry.get_queues(channel)
+        if not rings:
+            return
+
+        # Fast path: most broadcasts originate on the loop thread itself.
+        if registry.on_loop_thread():
+            self._fan_out_on_loop(rings, event)
             return
 
         loop = registry.get_loop()
         if loop is None or loop.is_closed():
             return
+        # One loop wakeup per broadcast, not one per subscriber.
+        loop.call_soon_threadsafe(self._fan_out_on_loop, rings, event)
 
-        try:
-            running_loop = asyncio.get_running_loop()
-        except RuntimeError:
-            running_loop = None
-
-        if running_loop is loop:
-            for queue in queues:
-                queue.put_nowait(event)
-        else:
-            for queue in queues:
-                loop.call_soon_threadsafe(queue.put_nowait, event)
+    def _fan_out_on_loop(self, rings, event):
+        """Push an event into each ring. Must run on the event loop thread."""
+        for ring in rings:
+            ring.push(event)
@@ -1,21 +1,82 @@
+import functools
 import json
+import re
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-def format_patch_elements(html, *, selector=None, mode=None):
-    """Format a datastar-patch-elements SSE event."""
-    lines = ["event: datastar-patch-elements"]
+if orjson is not None:
+    def _dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+else:
+    def _dumps(obj):
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+_ELEMENTS_EVENT = b"event: datastar-patch-elements\n"
+_SIGNALS_PREFIX = b"event: datastar-patch-signals\ndata: signals "
+
+_WS = re.compile(r"\s+")
+# SSE line terminators only; str.splitlines() would also split on \f, \v,
+# U+2028 and other characters that are plain text in verbatim HTML.
+_EOL = re.compile(r"\r\n|\r|\n")
+
+@functools.lru_cache(maxsize=256)
+def _make_formatter(selector, mode):
+    """Build a formatter specialised for one (selector, mode) pair.
+
+    The event/mode/selector header is baked into the closure as bytes, so
+    formatting an event is just the whitespace pass, an encode and a concat.
+    """
+    prefix = _ELEMENTS_EVENT
     if mode is not None:
-        lines.append(f"data: mode {mode}")
+        prefix += f"data: mode {mode}\n".encode()
     if selector is not None:
-        lines.append(f"data: selector {selector}")
-    lines.append(f"data: elements {' '.join(html.split())}")
-    return "\n".join(lines) + "\n\n"
+        prefix += f"data: selector {selector}\n".encode()
+    single_line = prefix + b"data: elements "
+    collapse = _WS.sub
+    split_lines = _EOL.split
+
+    def fmt(html, collapse_ws=True):
+        if collapse_ws:
+            return single_line + collapse(" ", html).strip().encode() + b"\n\n"
+        parts = split_lines(html)
+        if parts[-1] == "":
+            # A trailing terminator ends the last line; it is not a new one.
+            parts.pop()
+        lines = "".join(f"data: elements {line}\n" for line in parts)
+        return prefix + lines.encode() + b"\n"
+
+    return fmt
+
+
+def format_patch_elements(html, *, selector=None, mode=None, collapse_ws=True):
+    """Format a datastar-patch-elements SSE event as bytes.
+
+    By default whitespace in html is collapsed so it fits on a single data
+    line. With collapse_ws=False the html is sent verbatim, one data line
+    per source line.
+    """
+    return _make_formatter(selector, mode)(html, collapse_ws)
+
+
+@functools.lru_cache(maxsize=256)
+def _format_elements_cached(html, selector=None, mode=None):
+    """Memoized format_patch_elements for HTML that is re-sent unchanged.
+
+    Presence callbacks often re-render identical HTML; this skips the
+    whitespace pass and encode when they do.
+    """
+    return format_patch_elements(html, selector=selector, mode=mode)
 
 
 def format_patch_signals(signals):
-    """Format a datastar-patch-signals SSE event."""
-    signals_json = json.dumps(signals, separators=(",", ":"))
-    return f"event: datastar-patch-signals\ndata: signals {signals_json}\n\n"
+    """Format a datastar-patch-signals SSE event as bytes.
+
+    Uses orjson when installed (pip install ds-broadcaster[fast]).
+    """
+    return _SIGNALS_PREFIX + _dumps(signals) + b"\n\n"
 
 
-HEARTBEAT = ": ping\n\n"
+HEARTBEAT = b": ping\n\n"
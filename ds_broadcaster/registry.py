@@ -1,105 +1,186 @@
+"""In-memory registry of channels and their user rings.
+
+Threading model: the registry is single-writer and lock-free. Every mutation
+runs on the ASGI event loop thread; calls made from other threads (sync views
+in the thread pool) are handed to the loop and waited on. Reads take no lock
+and may come from any thread — they only use operations that are atomic
+under the GIL (dict lookups, list copies and list iteration).
+"""
+
 import asyncio
 import threading
 
+from .ring import SPSCRing
+
+
+async def _call(fn, *args):
+    return fn(*args)
+
 
 class ChannelRegistry:
-    """Thread-safe in-memory registry of channels and their user queues."""
+    """Single-writer in-memory registry of channels and their user rings."""
 
     def __init__(self):
-        self._channels: dict[str, set[asyncio.Queue]] = {}
+        self._channels: dict[str, list[SPSCRing]] = {}
         self._channel_config: dict[str, dict] = {}
-        self._queue_info: dict[asyncio.Queue, int] = {}
-        self._lock = threading.Lock()
+        self._queue_info: dict[SPSCRing, int] = {}
+        # channel -> {user_id: open connection count}, for O(unique) presence
+        self._channel_user_refs: dict[str, dict[int, int]] = {}
         self._loop: asyncio.AbstractEventLoop | None = None
+        # Remembers, per thread, which loop set_loop() was called from.
+        self._local = threading.local()
 
     def set_loop(self, loop):
-        """Store reference to the ASGI event loop. Called on first SSE connect."""
+        """Store reference to the ASGI event loop.
+
+        Called on every SSE connect, always from the loop's own thread.
+        """
         self._loop = loop
+        self._local.loop = loop
 
     def get_loop(self):
         return self._loop
 
+    def on_loop_thread(self):
+        """Return True if the caller is on the registry's event loop thread.
+
+        A thread-local lookup rather than asyncio.get_running_loop(), which
+        needs try/except on every call from a worker thread.
+        """
+        loop = self._loop
+        return loop is not None and getattr(self._local, "loop", None) is loop
+
+    def _apply(self, fn, *args):
+        """Run a mutation on the event loop thread and return its result.
+
+        Runs inline when already on the loop, or when no loop is running yet
+        (before the first SSE connect there is nothing to race with).
+        """
+        loop = self._loop
+        if loop is None or not loop.is_running() or self.on_loop_thread():
+            return fn(*args)
+        return asyncio.run_coroutine_threadsafe(_call(fn, *args), loop).result()
+
     def create(self, channel, **config):
         """Create channel if it doesn't exist. Idempotent.
 
         Optional config is stored with the channel (e.g. presence_callback).
         Config is only written on first creation; subsequent calls are no-ops.
         """
-        with self._lock:
-            if channel not in self._channels:
-                self._channels[channel] = set()
-                if config:
-                    self._channel_config[channel] = config
+        self._apply(self._create, channel, config)
+
+    def _create(self, channel, config):
+        if channel not in self._channels:
+            self._channels[channel] = []
+            if config:
+                self._channel_config[channel] = config
 
     def destroy(self, channel):
         """Remove channel and all its users."""
-        with self._lock:
-            queues = self._channels.pop(channel, set())
-            for q in queues:
-                self._queue_info.pop(q, None)
-            self._channel_config.pop(channel, None)
+        self._apply(self._destroy, channel)
+
+    def _destroy(self, channel):
+        queues = self._channels.pop(channel, [])
+        for q in queues:
+            self._queue_info.pop(q, None)
+        self._channel_config.pop(channel, None)
+        self._channel_user_refs.pop(channel, None)
 
     def get_config(self, channel):
         """Return config dict for a channel, or empty dict."""
-        with self._lock:
-            return self._channel_config.get(channel, {})
+        return self._channel_config.get(channel, {})
 
     def add_user(self, channel, queue, user_id):
         """Add user to channel, creating channel if needed.
 
         user_id is an int (the user's primary key).
         """
-        with self._lock:
-            if channel not in self._channels:
-                self._channels[channel] = set()
-            self._channels[channel].add(queue)
-            self._queue_info[queue] = user_id
+        self._apply(self._add_user, channel, queue, user_id)
+
+    def _add_user(self, channel, queue, user_id):
+        if channel not in self._channels:
+            self._channels[channel] = []
+        self._channels[channel].append(queue)
+        self._queue_info[queue] = user_id
+        refs = self._channel_user_refs.setdefault(channel, {})
+        refs[user_id] = refs.get(user_id, 0) + 1
 
     def remove_user(self, channel, queue):
         """Remove user from channel. Remove channel if empty."""
-        with self._lock:
-            users = self._channels.get(channel)
-            if users is not None:
-                users.discard(queue)
-                if not users:
-                    del self._channels[channel]
-            self._queue_info.pop(queue, None)
+        self._apply(self._remove_user, channel, queue)
+
+    def _remove_user(self, channel, queue):
+        users = self._channels.get(channel)
+        if users is not None:
+            # O(n) scan, but per-channel connection counts are small.
+            try:
+                users.remove(queue)
+            except ValueError:
+                pass
+            if not users:
+                del self._channels[channel]
+        if queue in self._queue_info:
+            user_id = self._queue_info.pop(queue)
+            refs = self._channel_user_refs.get(channel)
+            if refs is not None and user_id in refs:
+                if refs[user_id] > 1:
+                    refs[user_id] -= 1
+                else:
+                    del refs[user_id]
+                    if not refs:
+                        del self._channel_user_refs[channel]
 
     def get_channels(self):
         """Return list of active channel names."""
-        with self._lock:
-            return list(self._channels.keys())
+        return list(self._channels)
+
+    def channel_size(self, channel):
+        """Return the number of open connections on a channel (0 if none)."""
+        return len(self._channels.get(channel, ()))
+
+    def snapshot(self):
+        """Return {channel: (connection_count, unique_user_ids)} for all channels.
+
+        Reads everything in one pass instead of get_channels() followed by a
+        get_users() call per channel.
+        """
+        refs = self._channel_user_refs
+        return {
+            channel: (len(queues), list(refs.get(channel, ())))
+            for channel, queues in list(self._channels.items())
+        }
 
     def get_queues(self, channel):
-        """Return a snapshot (list copy) of queues for a channel."""
-        with self._lock:
-            queues = self._channels.get(channel)
-            if queues is None:
-                return []
-            return list(queues)
+        """Return the list of rings for a channel.
+
+        This is the registry's own list, not a copy — callers must not
+        mutate it.
+        """
+        return self._channels.get(channel, [])
 
     def get_users(self, channel):
         """Return list of user IDs (int) for a channel."""
-        with self._lock:
-            queues = self._channels.get(channel)
-            if queues is None:
-                return []
-            return [
-                self._queue_info[q]
-                for q in queues
-                if q in self._queue_info
-            ]
+        queues = self._channels.get(channel)
+        if queues is None:
+            return []
+        info = self._queue_info
+        # One lookup per ring: a membership test followed by info[q] could
+        # race with _remove_user on the loop thread and raise KeyError.
+        return [uid for q in queues if (uid := info.get(q)) is not None]
+
+    def get_unique_users(self, channel):
+        """Return deduplicated user IDs (int) for a channel, in connect order."""
+        return list(self._channel_user_refs.get(channel, ()))
 
     def get_queues_for_user(self, channel, user_id):
-        """Return queues belonging to a specific user on a channel."""
-        with self._lock:
-            queues = self._channels.get(channel)
-            if queues is None:
-                return []
-            return [
-                q for q in queues
-                if self._queue_info.get(q) == user_id
-            ]
+        """Return rings belonging to a specific user on a channel."""
+        queues = self._channels.get(channel)
+        if queues is None:
+            return []
+        return [
+            q for q in queues
+            if self._queue_info.get(q) == user_id
+        ]
 
 
 registry = ChannelRegistry()
@@ -0,0 +1,64 @@
+import asyncio
+
+
+class SPSCRing:
+    """Single-producer, single-consumer ring buffer of SSE events.
+
+    The producer is always the ASGI event loop (Broadcaster._put) and the
+    consumer is the connection's event stream, so push/pop are plain index
+    bumps — no locks, no per-event Futures. An asyncio.Event wakes the
+    consumer when the ring goes from empty to non-empty.
+
+    capacity must be a power of two. The ring doubles in size if a slow
+    client lets it fill up, so events are never dropped.
+    """
+
+    def __init__(self, capacity=256):
+        if capacity < 1 or capacity & (capacity - 1):
+            raise ValueError("capacity must be a power of two")
+        self._buf = [None] * capacity
+        self._mask = capacity - 1
+        self._head = 0
+        self._tail = 0
+        self._not_empty = asyncio.Event()
+
+    def push(self, event):
+        """Append an event. Must be called on the event loop thread."""
+        if self._tail - self._head > self._mask:
+            self._grow()
+        self._buf[self._tail & self._mask] = event
+        self._tail += 1
+        self._not_empty.set()
+
+    def empty(self):
+        return self._head == self._tail
+
+    async def wait_for_data(self):
+        """Wait until the ring holds at least one event."""
+        while self._head == self._tail:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+
+    def pop_nowait_all(self, max_batch=64):
+        """Drain up to max_batch pending events without waiting.
+
+        Returns a list of events, oldest first (empty if none are pending).
+        """
+        buf, mask, head = self._buf, self._mask, self._head
+        tail = min(self._tail, head + max_batch)
+        events = []
+        for i in range(head, tail):
+            events.append(buf[i & mask])
+            buf[i & mask] = None
+        self._head = tail
+        return events
+
+    def _grow(self):
+        """Double the capacity, unwrapping pending events to the front."""
+        size = self._tail - self._head
+        buf = [self._buf[i & self._mask] for i in range(self._head, self._tail)]
+        buf.extend([None] * size)
+        self._buf = buf
+        self._mask = len(buf) - 1
+        self._head = 0
+        self._tail = size
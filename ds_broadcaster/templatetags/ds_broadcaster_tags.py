@@ -1,3 +1,5 @@
+import functools
+
 from django import template
 
 register = template.Library()
@@ -6,7 +8,15 @@ register = template.Library()
 @register.filter
 def initials(email):
     """Extract first and last letter of the email local part."""
-    local = email.split("@")[0] if email else "?"
+    return _initials(email)
+
+
+@functools.lru_cache(maxsize=4096)
+def _initials(email):
+    if not email:
+        return "?"
+    idx = email.find("@")
+    local = email[:idx] if idx >= 0 else email
     if len(local) < 2:
         return local.upper()
     return (local[0] + local[-1]).upper()
@@ -0,0 +1,94 @@
+import asyncio
+
+from django.core.handlers.asgi import ASGIHandler
+from django.test import SimpleTestCase, override_settings
+from django.urls import path
+
+from . import broadcast
+from .registry import registry
+
+
+def _presence(channel, user_ids):
+    return f'<div id="presence">{len(user_ids)}</div>'
+
+
+def _sync_connect(request):
+    return broadcast.connect("tests-presence", request, presence_callback=_presence)
+
+
+urlpatterns = [
+    path("connect/", _sync_connect),
+]
+
+
+class _Client:
+    """Drives one streaming request through the ASGI handler."""
+
+    def __init__(self, app, path):
+        self.body = b""
+        self._received = asyncio.Event()
+        self._disconnect = asyncio.Event()
+        self._sent_request = False
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": b"",
+            "headers": [(b"host", b"testserver")],
+            "client": ("127.0.0.1", 1234),
+            "server": ("testserver", 80),
+        }
+        self.task = asyncio.create_task(app(scope, self._receive, self._send))
+
+    async def _receive(self):
+        if not self._sent_request:
+            self._sent_request = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await self._disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def _send(self, message):
+        if message["type"] == "http.response.body":
+            self.body += message.get("body", b"")
+            self._received.set()
+
+    async def wait_for(self, data, timeout=2):
+        async with asyncio.timeout(timeout):
+            while data not in self.body:
+                self._received.clear()
+                await self._received.wait()
+
+    async def close(self):
+        self._disconnect.set()
+        await asyncio.wait_for(self.task, 2)
+
+
+@override_settings(
+    ROOT_URLCONF=__name__,
+    MIDDLEWARE=[
+        "django.contrib.sessions.middleware.SessionMiddleware",
+        "django.contrib.auth.middleware.AuthenticationMiddleware",
+    ],
+)
+class PresenceOverASGITests(SimpleTestCase):
+    def tearDown(self):
+        registry._destroy("tests-presence")
+
+    def test_sync_connect_broadcasts_presence(self):
+        # Regression: the debounce timer used to inherit the sync view's
+        # context, whose thread executor has quit by the time it fires.
+        async def run():
+            app = ASGIHandler()
+            clients = [_Client(app, "/connect/"), _Client(app, "/connect/")]
+            try:
+                for client in clients:
+                    await client.wait_for(b'<div id="presence">1</div>')
+            finally:
+                for client in clients:
+                    await client.close()
+
+        asyncio.run(run())
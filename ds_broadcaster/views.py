@@ -1,13 +1,21 @@
+import re
 import time
+from io import StringIO
 
-import json
+try:
+    from orjson import loads as _loads
+except ImportError:
+    from json import loads as _loads
 
 from django.contrib.admin.views.decorators import staff_member_required
-from django.http import StreamingHttpResponse
+from django.contrib.auth.views import redirect_to_login
+from django.http import HttpResponse
 from django.shortcuts import render
+from django.urls import reverse
 
 from . import broadcast
 from .formatting import format_patch_elements
+from .registry import registry
 
 
 # --- Test views ---
@@ -19,19 +27,35 @@ def test_page(request):
     return render(request, "ds_broadcaster/test.html")
 
 
-@staff_member_required
-def test_sse(request, channel):
+async def test_sse(request, channel):
     """Test SSE endpoint — staff only."""
-    return broadcast.connect(channel, request)
+    # staff_member_required only wraps async views on Django 5.1+.
+    user = await request.auser()
+    if not (user.is_active and user.is_staff):
+        return redirect_to_login(request.get_full_path(), reverse("admin:login"))
+    return await broadcast.aconnect(channel, request)
+
+
+# Matches a body that starts with a plain (escape-free) channel_name signal.
+_CHANNEL_NAME_PREFIX = re.compile(rb'\{"channel_name":"([^"\\]*)"')
 
 
 def _get_channel(request):
     """Read channel_name from Datastar signals (POST body or GET param)."""
     if request.method == "POST" and request.body:
+        body = request.body
+        # Fast path: small bodies that lead with channel_name skip JSON parsing.
+        if len(body) < 256:
+            match = _CHANNEL_NAME_PREFIX.match(body)
+            if match:
+                try:
+                    return match.group(1).decode()
+                except UnicodeDecodeError:
+                    pass
         try:
-            signals = json.loads(request.body)
+            signals = _loads(body)
             return signals.get("channel_name", "test-channel")
-        except (json.JSONDecodeError, AttributeError):
+        except (ValueError, AttributeError):
             pass
     return request.GET.get("channel_name", "").strip("'\"") or "test-channel"
 
@@ -45,11 +69,12 @@ def _log_entry(message):
 
 
 def _sse_response(*fragments):
-    """Return a StreamingHttpResponse with pre-formatted SSE events."""
-    async def stream():
-        for f in fragments:
-            yield f
-    return StreamingHttpResponse(stream(), content_type="text/event-stream")
+    """Return an HttpResponse with pre-formatted SSE events.
+
+    The events are all known up front, so they are sent as one body rather
+    than streamed from an async generator.
+    """
+    return HttpResponse(b"".join(fragments), content_type="text/event-stream")
 
 
 
@@ -141,27 +166,29 @@ def test_status(request):
 
 def _registry_status_fragment():
     """Build an SSE fragment showing the current registry state."""
-    channel_names = broadcast.get_channels()
-
-    channel_info = {}
-    for ch in channel_names:
-        user_ids = broadcast.get_users(ch)
-        unique_ids = sorted(set(user_ids))
-        channel_info[ch] = {"count": len(user_ids), "ids": unique_ids}
+    snapshot = registry.snapshot()
 
-    if not channel_info:
+    if not snapshot:
         content = '<p class="text-gray-400">No channels</p>'
     else:
-        rows = "".join(
-            f"<tr><td>{ch}</td><td>{info['count']}</td>"
-            f"<td>{', '.join(str(i) for i in info['ids']) or '—'}</td></tr>"
-            for ch, info in sorted(channel_info.items())
-        )
-        content = (
+        buf = StringIO()
+        w = buf.write
+        w(
             '<table class="table table-sm">'
             "<thead><tr><th>Channel</th><th>Connections</th><th>User IDs</th></tr></thead>"
-            f"<tbody>{rows}</tbody></table>"
+            "<tbody>"
         )
+        for ch in sorted(snapshot):
+            count, user_ids = snapshot[ch]
+            w("<tr><td>")
+            w(ch)
+            w("</td><td>")
+            w(str(count))
+            w("</td><td>")
+            w(", ".join(str(i) for i in sorted(user_ids)) or "—")
+            w("</td></tr>")
+        w("</tbody></table>")
+        content = buf.getvalue()
 
     return format_patch_elements(
         content,
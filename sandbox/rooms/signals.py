@@ -0,0 +1,18 @@
+from django.db.models.signals import m2m_changed, post_delete
+from django.dispatch import receiver
+
+from .models import Room
+from .views import clear_membership_caches
+
+
+@receiver(m2m_changed, sender=Room.members.through)
+def members_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        clear_membership_caches()
+
+
+@receiver(post_delete, sender=Room)
+def room_deleted(sender, **kwargs):
+    # Deleting a room cascades to its membership rows without sending
+    # m2m_changed.
+    clear_membership_caches()
@@ -1,13 +1,31 @@
+import functools
+
 from django import template
 
 register = template.Library()
 
+PALETTE = [
+    "#b91c1c",  # red-700
+    "#0369a1",  # sky-700
+    "#a16207",  # yellow-700
+    "#6d28d9",  # violet-700
+    "#134e4a",  # teal-900
+    "#be123c",  # rose-700
+    "#4d7c0f",  # lime-700
+    "#7c2d12",  # orange-900
+    "#556b2f",  # olive-600
+    "#1a2e05",  # olive-950
+]
+
+
 @register.filter
-def lookup(d, key):
-    """Look up a key in a dict. Usage: {{ colours|lookup:user.pk }}"""
-    if isinstance(d, dict):
-        return d.get(key, "")
-    return ""
+def user_colour(user_pk):
+    """Return a user's colour. Usage: {{ user.pk|user_colour }}
+
+    Derived from the pk alone, so it is stable per user and needs no
+    membership lookup.
+    """
+    return PALETTE[user_pk % len(PALETTE)]
 
 
 @register.filter
@@ -19,13 +37,21 @@ def initials(user):
     Never crashes on missing/blank fields.
     """
     if isinstance(user, dict):
-        first = (user.get("first_name") or "").strip()
-        last = (user.get("last_name") or "").strip()
-        email = (user.get("email") or "").strip()
+        first = user.get("first_name")
+        last = user.get("last_name")
+        email = user.get("email")
     else:
-        first = (getattr(user, "first_name", None) or "").strip()
-        last = (getattr(user, "last_name", None) or "").strip()
-        email = (getattr(user, "email", None) or "").strip()
+        first = getattr(user, "first_name", None)
+        last = getattr(user, "last_name", None)
+        email = getattr(user, "email", None)
+    return _initials(first or "", last or "", email or "")
+
+
+@functools.lru_cache(maxsize=4096)
+def _initials(first, last, email):
+    first = first.strip()
+    last = last.strip()
+    email = email.strip()
 
     if first and last:
         return (first[0] + last[0]).upper()
@@ -34,7 +60,8 @@ def initials(user):
     if last:
         return last[0].upper()
     if email:
-        local = email.split("@")[0]
+        idx = email.find("@")
+        local = email[:idx] if idx >= 0 else email
         if len(local) >= 2:
             return (local[0] + local[1]).upper()
         return local[0].upper() if local else "?"
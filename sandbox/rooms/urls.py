@@ -9,5 +9,6 @@ urlpatterns = [
     path('<int:pk>/delete/', views.room_delete, name='room_delete'),
     path('<int:pk>/connect/', views.room_connect, name='room_connect'),
     path('<int:pk>/send/', views.room_send_message, name='room_send_message'),
+    path('<int:pk>/history/<int:before_id>/', views.room_history, name='room_history'),
     path('<int:pk>/cursor/', views.room_cursor, name='room_cursor'),
 ]
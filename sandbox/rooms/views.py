@@ -1,74 +1,248 @@
-import json
+import logging
+import threading
+import time
+from functools import cache, lru_cache
 
+try:
+    from orjson import loads as _loads
+except ImportError:
+    from json import loads as _loads
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, Max
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse, StreamingHttpResponse
+from django.http import Http404, HttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.template.loader import render_to_string
+from django.template.loader import get_template, render_to_string
 from .models import Room, Message
 from .forms import RoomForm, RoomMemberForm
+from .templatetags.rooms_tags import initials, user_colour
 from ds_broadcaster import broadcast
-from ds_broadcaster.formatting import format_patch_signals
+from ds_broadcaster.formatting import format_patch_elements, format_patch_signals
+
+User = get_user_model()
+
+logger = logging.getLogger(__name__)
+
+MEMBERS_CACHE_TTL = 30  # seconds
+
+# room_pk -> (fetched_at, members); see _get_members.
+_members_cache: dict[int, tuple[float, tuple]] = {}
+
+
+def _get_members(room_pk):
+    """Return a room's members, cached for MEMBERS_CACHE_TTL.
+
+    Presence and chat sends hit this on every event, so membership is only
+    re-queried when the entry expires or clear_membership_caches() runs.
+    """
+    room_pk = int(room_pk)
+    entry = _members_cache.get(room_pk)
+    now = time.monotonic()
+    if entry is not None and now - entry[0] < MEMBERS_CACHE_TTL:
+        return entry[1]
+    # One query through the M2M join rather than fetching the Room first,
+    # selecting only the columns the member templates and initials use.
+    members = tuple(
+        User.objects.filter(rooms=room_pk)
+        .only('pk', 'email', 'first_name', 'last_name')
+        .order_by('pk')
+    )
+    _members_cache[room_pk] = (now, members)
+    return members
+
+
+def _member_exists(user_id, room_id):
+    """Uncached membership check: a single EXISTS on the M2M table."""
+    return Room.members.through.objects.filter(room_id=room_id, user_id=user_id).exists()
+
+
+@lru_cache(maxsize=4096)
+def _is_member(user_id, room_id):
+    """Cached membership check for hot endpoints.
+
+    Cleared by clear_membership_caches() whenever membership changes.
+    """
+    return _member_exists(user_id, room_id)
+
+
+def clear_membership_caches():
+    """Drop every cached view of room membership.
+
+    Connected in rooms.signals to m2m_changed on Room.members and to Room
+    deletion, so edits from any path (views, admin, shell) take effect
+    immediately. Membership changes are rare, so everything is cleared
+    rather than tracking which rooms and users were affected.
+    """
+    _members_cache.clear()
+    _last_online.clear()
+    _is_member.cache_clear()
+
+
+def _require_member(user, room_pk, *, cached=True):
+    """Raise Http404 unless user is a member of the room.
+
+    For views that only need the room's pk, so they skip fetching the Room.
+    Views that write or open a stream pass cached=False to check the
+    database directly.
+    """
+    check = _is_member if cached else _member_exists
+    if not check(user.pk, room_pk):
+        raise Http404
+
+
+CURSOR_FLUSH_INTERVAL = 0.016  # seconds, ~one frame at 60Hz
+
+# channel -> merged cursor signals waiting for the next flush.
+_cursor_pending: dict[str, dict] = {}
+_cursor_lock = threading.Lock()
+_cursor_ready = threading.Event()
+_cursor_flusher = None
+
+
+def _queue_cursor(channel, signals):
+    """Buffer cursor signals; the flusher thread broadcasts them in batches.
+
+    Updates for the same key within one flush window overwrite each other,
+    so a burst of pointer events becomes one broadcast per channel.
+    """
+    global _cursor_flusher
+    with _cursor_lock:
+        _cursor_pending.setdefault(channel, {}).update(signals)
+        if _cursor_flusher is None:
+            _cursor_flusher = threading.Thread(
+                target=_flush_cursors, name="cursor-flusher", daemon=True
+            )
+            _cursor_flusher.start()
+    _cursor_ready.set()
+
 
-PALETTE = [
-    "#b91c1c",  # red-700
-    "#0369a1",  # sky-700
-    "#a16207",  # yellow-700
-    "#6d28d9",  # violet-700
-    "#134e4a",  # teal-900
-    "#be123c",  # rose-700
-    "#4d7c0f",  # lime-700
-    "#7c2d12",  # orange-900
-    "#556b2f",  # olive-600
-    "#1a2e05",  # olive-950
-]
+def _flush_cursors():
+    while True:
+        _cursor_ready.wait()
+        time.sleep(CURSOR_FLUSH_INTERVAL)
+        with _cursor_lock:
+            pending = _cursor_pending.copy()
+            _cursor_pending.clear()
+            _cursor_ready.clear()
+        for channel, signals in pending.items():
+            # One failed broadcast must not kill the flusher, or every
+            # later cursor update would queue up and never be sent.
+            try:
+                broadcast.signals(channel, signals)
+            except Exception:
+                logger.exception("Cursor broadcast to %s failed", channel)
 
 
-def _member_colours(members):
-    """Return a dict mapping user_id -> colour for a list of members."""
-    return {u.pk: PALETTE[i % len(PALETTE)] for i, u in enumerate(members)}
+@lru_cache(maxsize=8192)
+def _member_fragment(label, online, colour):
+    """Render one member avatar; identical avatars are rendered once."""
+    return render_to_string('rooms/_member_row.html', {
+        'initials': label,
+        'online': online,
+        'colour': colour,
+    })
+
+
+def _member_rows(members, online_set):
+    """Return rendered avatars for members, online ones first."""
+    online = [u for u in members if u.pk in online_set]
+    offline = [u for u in members if u.pk not in online_set]
+    return (
+        [_member_fragment(initials(u), True, user_colour(u.pk)) for u in online] +
+        [_member_fragment(initials(u), False, user_colour(u.pk)) for u in offline]
+    )
+
+
+# channel -> online user IDs at the last presence broadcast.
+_last_online: dict[str, frozenset] = {}
 
 
 def _room_presence(channel, online_ids):
+    """Presence callback for room channels.
+
+    Needs no locking of its own: the broadcaster debounces presence per
+    channel, never runs this concurrently for the same channel, and re-runs
+    it with the latest user list if connections changed mid-call.
+    """
+    online_set = frozenset(online_ids)
+    if _last_online.get(channel) == online_set:
+        # Nothing changed since the last broadcast; send nothing.
+        return ('', {})
+    _last_online[channel] = online_set
     room_pk = channel.removeprefix("room-")
-    room = Room.objects.get(pk=room_pk)
-    online_set = set(online_ids)
-    all_members = list(room.members.all())
-    colours = _member_colours(all_members)
-    online = [u for u in all_members if u.pk in online_set]
-    offline = [u for u in all_members if u.pk not in online_set]
-    users = (
-        [{"user": u, "online": True, "colour": colours[u.pk]} for u in online] +
-        [{"user": u, "online": False, "colour": colours[u.pk]} for u in offline]
+    all_members = _get_members(room_pk)
+    html = render_to_string("rooms/_members.html", {
+        "rows": _member_rows(all_members, online_set),
+    })
+    # Colours are fixed per pk and set by the canvas at page load, so only
+    # the online cursor list goes out with the HTML. The canvas hides cursors
+    # of users not in it, so the payload grows with who is online, not with
+    # room size.
+    return (html, {'cursor_active_pks': sorted(online_set)})
+
+
+HISTORY_PAGE_SIZE = 50
+
+
+def _message_page(room_pk, before_id=None):
+    """Return (messages, before_id) for one page of chat history.
+
+    messages are the newest HISTORY_PAGE_SIZE messages older than before_id,
+    oldest first. The returned before_id is the cursor for the next page, or
+    None once the start of the room is reached.
+    """
+    # Only the columns _message.html renders, for the message and its author.
+    qs = (
+        Message.objects.filter(room_id=room_pk)
+        .select_related('author')
+        .only(
+            'id', 'body', 'created_at', 'author',
+            'author__email', 'author__first_name', 'author__last_name',
+        )
+        .order_by('-id')
     )
-    cursor_signals = {f'cursor_{u.pk}_active': False for u in offline}
-    if cursor_signals:
-        broadcast.signals(channel, cursor_signals)
-    html = render_to_string("rooms/_members.html", {"users": users})
-    colour_signals = {f'user_{uid}_colour': colour for uid, colour in colours.items()}
-    return (html, colour_signals)
+    if before_id is not None:
+        qs = qs.filter(id__lt=before_id)
+    # Fetch one extra row to learn whether an older page exists.
+    page = list(qs[:HISTORY_PAGE_SIZE + 1])
+    has_more = len(page) > HISTORY_PAGE_SIZE
+    page = page[:HISTORY_PAGE_SIZE]
+    page.reverse()
+    return page, (page[0].pk if has_more else None)
 
 
 @login_required
 def room_list(request):
-    rooms = request.user.rooms.all()
+    # Filter by pk rather than through request.user.rooms: annotating the
+    # members join that the filter already uses would count only this user.
+    rooms = (
+        Room.objects.filter(pk__in=request.user.rooms.values('pk'))
+        .annotate(
+            member_count=Count('members', distinct=True),
+            last_message_at=Max('messages__created_at'),
+        )
+        .order_by(F('last_message_at').desc(nulls_last=True), 'pk')
+    )
     return render(request, 'rooms/room_list.html', {'rooms': rooms})
 
 
 @login_required
 def room_detail(request, pk):
     room = get_object_or_404(Room, pk=pk, members=request.user)
+    # The page renders everyone offline, so the next presence tick must
+    # broadcast even if the online set looks unchanged.
+    _last_online.pop(f'room-{room.pk}', None)
     room_members = list(room.members.all())
-    colours = _member_colours(room_members)
-    members = [{"user": u, "online": False, "colour": colours[u.pk]} for u in room_members]
-    chat_messages = room.messages.select_related('author').all()
+    chat_messages, history_before = _message_page(room.pk)
     return render(request, 'rooms/room_detail.html', {
         'room': room,
         'user_id': request.user.pk,
-        'members': members,
+        'member_rows': _member_rows(room_members, set()),
         'room_members': room_members,
         'chat_messages': chat_messages,
-        'colours': colours,
+        'history_before': history_before,
     })
 
 
@@ -133,46 +307,78 @@ def room_delete(request, pk):
 
 @login_required
 def room_connect(request, pk):
-    room = get_object_or_404(Room, pk=pk, members=request.user)
-    return broadcast.connect(f"room-{room.pk}", request, presence_callback=_room_presence)
+    _require_member(request.user, pk, cached=False)
+    return broadcast.connect(f"room-{pk}", request, presence_callback=_room_presence)
+
+
+@cache
+def _message_template():
+    """Return the compiled chat message template, resolved once per process."""
+    return get_template('rooms/_message.html')
+
+
+def _deliver_message(room_pk, author_pk, body):
+    """Persist a chat message and broadcast it to the room.
+
+    Takes only plain values (pks and the body) so it can be handed to a
+    background worker as-is; the view currently calls it inline. The author
+    is fetched when the message renders.
+    """
+    msg = Message.objects.create(room_id=room_pk, author_id=author_pk, body=body)
+    html = _message_template().render({'msg': msg})
+    broadcast(f'room-{room_pk}', html, selector='#chat-feed', mode='append')
+
+
+# The reply to every send is the same single event, so format it once.
+_CLEAR_MESSAGE_EVENT = format_patch_signals({'message_to_send': ''})
 
 
 @login_required
 def room_send_message(request, pk):
-    room = get_object_or_404(Room, pk=pk, members=request.user)
+    _require_member(request.user, pk, cached=False)
     try:
-        signals = json.loads(request.body)
+        signals = _loads(request.body)
         body = signals.get('message_to_send', '').strip()
-    except (json.JSONDecodeError, AttributeError):
+    except (ValueError, AttributeError):
         body = ''
     if body:
-        msg = Message.objects.create(room=room, author=request.user, body=body)
-        room_members = list(room.members.all())
-        colours = _member_colours(room_members)
-        html = render_to_string('rooms/_message.html', {
-            'msg': msg,
-            'colour': colours.get(msg.author.pk, PALETTE[0]),
-        })
-        broadcast(f'room-{room.pk}', html, selector='#chat-feed', mode='append')
+        _deliver_message(pk, request.user.pk, body)
+    return HttpResponse(_CLEAR_MESSAGE_EVENT, content_type='text/event-stream')
 
-    async def stream():
-        yield format_patch_signals({'message_to_send': ''})
 
-    return StreamingHttpResponse(stream(), content_type='text/event-stream')
+@login_required
+def room_history(request, pk, before_id):
+    """Send the page of messages before before_id, above what is loaded."""
+    _require_member(request.user, pk)
+    page, next_before = _message_page(pk, before_id)
+    template = _message_template()
+    html = ''.join(
+        template.render({'msg': msg, 'history': True})
+        for msg in page
+    )
+    events = [format_patch_elements(html, selector='#chat-history', mode='after')]
+    if next_before is None:
+        events.append(format_patch_elements('', selector='#chat-history', mode='remove'))
+    else:
+        events.append(format_patch_elements(render_to_string('rooms/_history_button.html', {
+            'room_pk': pk,
+            'before_id': next_before,
+        })))
+    return HttpResponse(b''.join(events), content_type='text/event-stream')
 
 
 @login_required
 def room_cursor(request, pk):
-    room = get_object_or_404(Room, pk=pk, members=request.user)
+    _require_member(request.user, pk)
     try:
-        data = json.loads(request.body)
+        data = _loads(request.body)
         x = data.get('cursor_x', 0)
         y = data.get('cursor_y', 0)
-    except (json.JSONDecodeError, AttributeError):
+    except (ValueError, AttributeError):
         x, y = 0, 0
 
     uid = request.user.pk
-    broadcast.signals(f'room-{room.pk}', {
+    _queue_cursor(f'room-{pk}', {
         f'cursor_{uid}_x': x,
         f'cursor_{uid}_y': y,
         f'cursor_{uid}_active': True,